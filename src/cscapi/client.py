@@ -5,7 +5,7 @@ import time
 from collections import defaultdict
 from dataclasses import asdict, replace, dataclass
 from importlib import metadata
-from typing import Dict, Iterable, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import httpx
 import jwt
@@ -55,6 +55,7 @@ class CAPIClientConfig:
     latency_offset: int = 10
     retry_delay: int = 5
     logger: logging.Logger = null_logger
+    http_client: Optional[httpx.Client] = None
 
 
 def _group_signals_by_machine_id(
@@ -77,14 +78,15 @@ class CAPIClient:
 
         self.url = CAPI_BASE_URL if config.prod else CAPI_BASE_DEV_URL
 
-        self.http_client = httpx.Client()
+        # Reusing a caller-provided client keeps its connection pool warm
+        # across CAPIClient instances.
+        self.http_client = config.http_client or httpx.Client()
         self.http_client.headers.update(
             {"User-Agent": f"{config.user_agent_prefix}-capi-py-sdk/{__version__}"}
         )
 
     def add_signals(self, signals: List[SignalModel]):
-        for signal in signals:
-            self.storage.update_or_create_signal(signal)
+        self.storage.update_or_create_signals(signals)
 
     def prune_failing_machines_signals(
         self, batch_size: int = SIGNAL_BATCH_LIMIT
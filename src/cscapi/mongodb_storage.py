@@ -185,6 +185,36 @@ class MongoDBStorage(StorageInterface):
             signal_db_model = SignalDBModel(**signal_filtered)
             created = True
 
+        self._set_embedded_fields(signal_db_model, signal)
+
+        # Save the model (works for both creating a new document and updating an existing one)
+        signal_db_model.save()
+
+        return created
+
+    def update_or_create_signals(self, signals: List[SignalModel]):
+        # Fresh signals go through a single insert_many instead of one
+        # save round-trip each; signals carrying an alert_id still take
+        # the per-document upsert path.
+        to_insert = []
+        for signal in signals:
+            if signal.alert_id is not None:
+                self.update_or_create_signal(signal)
+                continue
+            signal_filtered = {
+                k: v
+                for k, v in asdict(signal).items()
+                if k not in ["source", "context", "decisions"]
+            }
+            signal_db_model = SignalDBModel(**signal_filtered)
+            self._set_embedded_fields(signal_db_model, signal)
+            to_insert.append(signal_db_model)
+
+        if to_insert:
+            SignalDBModel.objects.insert(to_insert)
+
+    @staticmethod
+    def _set_embedded_fields(signal_db_model: SignalDBModel, signal: SignalModel):
         # Update or set the source, context, and decisions fields
         if signal.source:
             signal_db_model.source = SourceDBModel(**asdict(signal.source))
@@ -199,11 +229,6 @@ class MongoDBStorage(StorageInterface):
                 DecisionDBModel(**asdict(dec)) for dec in signal.decisions
             ]
 
-        # Save the model (works for both creating a new document and updating an existing one)
-        signal_db_model.save()
-
-        return created
-
     def delete_signals(self, signal_ids: List[int]):
         SignalDBModel.objects.filter(alert_id__in=signal_ids).delete()
 
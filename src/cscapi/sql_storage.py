@@ -1,7 +1,9 @@
-from dataclasses import asdict
-from typing import List, Optional
+import threading
+import time
+from dataclasses import asdict, replace
+from typing import Dict, Iterator, List, Optional
 
-from dacite import from_dict
+from more_itertools import batched
 from sqlalchemy import (
     Boolean,
     Column,
@@ -12,6 +14,9 @@ from sqlalchemy import (
     String,
     create_engine,
     delete,
+    insert,
+    literal,
+    select,
     update,
     event,
     or_,
@@ -26,10 +31,14 @@ from sqlalchemy.orm import (
     selectinload,
 )
 
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine import Engine
 from sqlite3 import Connection as SQLiteConnection
 from cscapi import storage
 
+# Keep IN clauses under SQLite's default limit of 999 bound variables.
+DELETE_CHUNK_SIZE = 500
+
 
 """
 By default, foreign key constraints are disabled in SQLite.
@@ -112,16 +121,18 @@ class SignalDBModel(Base):
     __tablename__ = "signal_models"
 
     alert_id = Column(Integer, primary_key=True, autoincrement=True)
-    created_at = Column(TEXT)
+    # Timestamps and uuids have a fixed short format; sized String columns
+    # keep the B-tree keys small compared to unbounded TEXT.
+    created_at = Column(String(64))
     machine_id = Column(String(128))
     scenario_version = Column(TEXT, nullable=True)
     message = Column(TEXT, nullable=True)
-    uuid = Column(TEXT)
-    start_at = Column(TEXT, nullable=True)
+    uuid = Column(String(36))
+    start_at = Column(String(64), nullable=True)
     scenario_trust = Column(TEXT, nullable=True)
     scenario_hash = Column(TEXT, nullable=True)
     scenario = Column(TEXT, nullable=True)
-    stop_at = Column(TEXT, nullable=True)
+    stop_at = Column(String(64), nullable=True)
     sent = Column(Boolean, default=False)
 
     context: Mapped[List["ContextDBModel"]] = relationship(
@@ -143,10 +154,65 @@ class SignalDBModel(Base):
 
 
 class SQLStorage(storage.StorageInterface):
-    def __init__(self, connection_string="sqlite:///cscapi.db") -> None:
-        engine = create_engine(connection_string, echo=False)
+    def __init__(
+        self,
+        connection_string="sqlite:///cscapi.db",
+        flush_every: Optional[int] = None,
+        flush_interval_s: Optional[float] = None,
+    ) -> None:
+        # Each method opens its own short-lived session, so allow the
+        # underlying SQLite connections to move between worker threads.
+        connect_args = (
+            {"check_same_thread": False}
+            if connection_string.startswith("sqlite")
+            else {}
+        )
+        engine = create_engine(connection_string, echo=False, connect_args=connect_args)
         Base.metadata.create_all(engine)
-        self.session = sessionmaker(bind=engine)
+        self.engine = engine
+        # expire_on_commit=False skips the attribute reload after each commit;
+        # results are converted to plain models before the session closes.
+        self.session = sessionmaker(bind=engine, expire_on_commit=False)
+        self._dialect_name = engine.dialect.name
+        # Opt-in write buffer: when flush_every and/or flush_interval_s is
+        # set, update_or_create_signal queues rows and commits them in one
+        # transaction instead of one BEGIN/COMMIT per signal. Buffered rows
+        # are invisible to reads until flush() runs.
+        self._flush_every = flush_every
+        self._flush_interval_s = flush_interval_s
+        self._pending: List[storage.SignalModel] = []
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.time()
+        # Machines are a small, slowly-changing set that is looked up once per
+        # signal push; cache them to avoid a DB roundtrip on the hot path.
+        self._machine_cache: Dict[str, storage.MachineModel] = {}
+        self._machine_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _filter_signals(query, sent: Optional[bool], is_failing: Optional[bool]):
+        if sent is not None:
+            if sent:
+                query = query.filter(SignalDBModel.sent == True)
+            else:
+                query = query.filter(
+                    or_(SignalDBModel.sent.is_(False), SignalDBModel.sent == None)
+                )
+
+        if is_failing is not None:
+            query = query.outerjoin(
+                MachineDBModel,
+                MachineDBModel.machine_id == SignalDBModel.machine_id,
+            )
+            if is_failing:
+                query = query.filter(MachineDBModel.is_failing == True)
+            else:
+                query = query.filter(
+                    or_(
+                        MachineDBModel.is_failing == False,
+                        MachineDBModel.is_failing == None,
+                    )
+                )
+        return query
 
     def get_signals(
         self,
@@ -160,68 +226,79 @@ class SQLStorage(storage.StorageInterface):
                 selectinload("*"),
                 joinedload(SignalDBModel.source),
             )
-            if sent is not None:
-                if sent:
-                    query = query.filter(SignalDBModel.sent == True)
-                else:
-                    query = query.filter(
-                        or_(SignalDBModel.sent.is_(False), SignalDBModel.sent == None)
-                    )
-
-            if is_failing is not None:
-                query = query.outerjoin(
-                    MachineDBModel,
-                    MachineDBModel.machine_id == SignalDBModel.machine_id,
-                )
-                if is_failing:
-                    query = query.filter(MachineDBModel.is_failing == True)
-                else:
-                    query = query.filter(
-                        or_(
-                            MachineDBModel.is_failing == False,
-                            MachineDBModel.is_failing == None,
-                        )
-                    )
-
+            query = self._filter_signals(query, sent, is_failing)
             query = query.limit(limit).offset(offset)
             results = query.all()
-            return [from_dict(storage.SignalModel, res.to_dict()) for res in results]
+            return [storage.signal_from_dict(res.to_dict()) for res in results]
+
+    def iter_signals(
+        self,
+        sent: Optional[bool] = None,
+        is_failing: Optional[bool] = None,
+        batch_size: int = 500,
+    ) -> Iterator[storage.SignalModel]:
+        # Streams the whole table in batches of batch_size so peak memory
+        # stays bounded instead of materializing every signal at once.
+        with self.session.begin() as session:
+            query = session.query(SignalDBModel).options(selectinload("*"))
+            query = self._filter_signals(query, sent, is_failing)
+            for res in query.yield_per(batch_size):
+                yield storage.signal_from_dict(res.to_dict())
 
     def get_machine_by_id(self, machine_id: str) -> Optional[storage.MachineModel]:
+        with self._machine_cache_lock:
+            cached = self._machine_cache.get(machine_id)
+        if cached is not None:
+            # Copy so callers mutating the result do not poison the cache.
+            return replace(cached)
+        stmt = select(
+            MachineDBModel.machine_id,
+            MachineDBModel.token,
+            MachineDBModel.password,
+            MachineDBModel.scenarios,
+            MachineDBModel.is_failing,
+        ).where(MachineDBModel.machine_id == machine_id)
         with self.session.begin() as session:
-            existing = (
-                session.query(MachineDBModel)
-                .filter(MachineDBModel.machine_id == machine_id)
-                .first()
-            )
-            if not existing:
+            row = session.execute(stmt).first()
+            if row is None:
                 return None
-            return storage.MachineModel(
-                machine_id=existing.machine_id,
-                token=existing.token,
-                password=existing.password,
-                scenarios=existing.scenarios,
-                is_failing=existing.is_failing,
-            )
+            machine = storage.MachineModel(*row)
+        with self._machine_cache_lock:
+            self._machine_cache[machine_id] = replace(machine)
+        return machine
 
     def update_or_create_machine(self, machine: storage.MachineModel) -> bool:
+        vals = asdict(machine)
         with self.session.begin() as session:
-            existing = (
-                session.query(MachineDBModel)
-                .filter(MachineDBModel.machine_id == machine.machine_id)
-                .all()
-            )
-            if not existing:
-                session.add(MachineDBModel(**asdict(machine)))
-                return True
-
-            update_stmt = (
-                update(MachineDBModel)
-                .where(MachineDBModel.machine_id == machine.machine_id)
-                .values(**asdict(machine))
-            )
-            session.execute(update_stmt)
-        return False
+            if self._dialect_name == "sqlite":
+                # One INSERT tells us whether the row existed; only a conflict
+                # costs a second UPDATE statement.
+                result = session.execute(
+                    sqlite_insert(MachineDBModel)
+                    .values(**vals)
+                    .on_conflict_do_nothing(index_elements=["machine_id"])
+                )
+                created = result.rowcount == 1
+            else:
+                created = (
+                    session.execute(
+                        select(literal(1))
+                        .select_from(MachineDBModel)
+                        .where(MachineDBModel.machine_id == machine.machine_id)
+                    ).first()
+                    is None
+                )
+                if created:
+                    session.add(MachineDBModel(**vals))
+            if not created:
+                session.execute(
+                    update(MachineDBModel)
+                    .where(MachineDBModel.machine_id == machine.machine_id)
+                    .values(**vals)
+                )
+        with self._machine_cache_lock:
+            self._machine_cache[machine.machine_id] = replace(machine)
+        return created
 
     def mass_update_signals(self, signal_ids: List[int], changes: dict):
         with self.session.begin() as session:
@@ -230,6 +307,71 @@ class SQLStorage(storage.StorageInterface):
             session.execute(stmt)
 
     def update_or_create_signal(self, signal: storage.SignalModel) -> bool:
+        if self._flush_every is None and self._flush_interval_s is None:
+            with self.session.begin() as session:
+                return self._upsert_signal(session, signal)
+
+        with self._pending_lock:
+            self._pending.append(signal)
+            flush_due = (
+                self._flush_every is not None
+                and len(self._pending) >= self._flush_every
+            ) or (
+                self._flush_interval_s is not None
+                and time.time() - self._last_flush >= self._flush_interval_s
+            )
+        if flush_due:
+            self.flush()
+        # Buffered rows have not hit the DB yet, so created-vs-updated is
+        # unknown; report created, the overwhelmingly common case.
+        return True
+
+    def update_or_create_signals(self, signals: List[storage.SignalModel]):
+        if self._flush_every is None and self._flush_interval_s is None:
+            # One transaction for the whole batch; the child-row inserts go
+            # through executemany, which SQLAlchemy folds into multi-VALUES
+            # statements (insertmanyvalues) on supporting dialects.
+            with self.session.begin() as session:
+                for signal in signals:
+                    self._upsert_signal(session, signal)
+            return
+
+        with self._pending_lock:
+            self._pending.extend(signals)
+            flush_due = (
+                self._flush_every is not None
+                and len(self._pending) >= self._flush_every
+            ) or (
+                self._flush_interval_s is not None
+                and time.time() - self._last_flush >= self._flush_interval_s
+            )
+        if flush_due:
+            self.flush()
+
+    def flush(self):
+        """Write any buffered signals in a single transaction."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.time()
+        if not pending:
+            return
+        with self.session.begin() as session:
+            for signal in pending:
+                self._upsert_signal(session, signal)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def __del__(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+    def _upsert_signal(self, session, signal: storage.SignalModel) -> bool:
         to_insert = SignalDBModel(
             **{
                 k: v
@@ -252,28 +394,81 @@ class SQLStorage(storage.StorageInterface):
                 DecisionDBModel(**{"signal_id": to_insert.alert_id} | asdict(dec))
                 for dec in signal.decisions
             ]
-        with self.session.begin() as session:
-            existing = (
-                session.query(SignalDBModel)
-                .filter(SignalDBModel.alert_id == signal.alert_id)
-                .first()
-            )
-
-            if not existing:
-                session.add(to_insert)
-                return True
+        existing = session.execute(
+            select(literal(1))
+            .select_from(SignalDBModel)
+            .where(SignalDBModel.alert_id == signal.alert_id)
+        ).first()
+
+        if not existing:
+            session.add(to_insert)
+            return True
+
+        # A single Core UPDATE instead of a per-column setattr loop, which
+        # would trigger one change-tracking event per column plus a flush.
+        cols = {
+            c.name: getattr(to_insert, c.name)
+            for c in SignalDBModel.__table__.columns
+            if c.name != "alert_id"
+        }
+        session.execute(
+            update(SignalDBModel)
+            .where(SignalDBModel.alert_id == signal.alert_id)
+            .values(**cols)
+        )
 
-            for c in to_insert.__table__.columns:
-                setattr(existing, c.name, getattr(to_insert, c.name))
+        # Children are replaced wholesale: one DELETE plus one bulk INSERT
+        # per table rather than ORM-managed per-row flushes.
+        if signal.source:
+            session.execute(
+                delete(SourceDBModel).where(SourceDBModel.signal_id == signal.alert_id)
+            )
+            session.execute(
+                insert(SourceDBModel),
+                [{"signal_id": signal.alert_id} | asdict(signal.source)],
+            )
+        if signal.context:
+            session.execute(
+                delete(ContextDBModel).where(
+                    ContextDBModel.signal_id == signal.alert_id
+                )
+            )
+            session.execute(
+                insert(ContextDBModel),
+                [
+                    {"signal_id": signal.alert_id} | asdict(ctx)
+                    for ctx in signal.context
+                ],
+            )
+        if signal.decisions:
+            session.execute(
+                delete(DecisionDBModel).where(
+                    DecisionDBModel.signal_id == signal.alert_id
+                )
+            )
+            session.execute(
+                insert(DecisionDBModel),
+                [
+                    {"signal_id": signal.alert_id} | asdict(dec)
+                    for dec in signal.decisions
+                ],
+            )
 
         return False
 
     def delete_signals(self, signal_ids: List[int]):
-        stmt = delete(SignalDBModel).where(SignalDBModel.alert_id.in_(signal_ids))
         with self.session.begin() as session:
-            session.execute(stmt)
+            for chunk in batched(signal_ids, DELETE_CHUNK_SIZE):
+                session.execute(
+                    delete(SignalDBModel).where(SignalDBModel.alert_id.in_(chunk))
+                )
 
     def delete_machines(self, machine_ids: List[str]):
-        stmt = delete(MachineDBModel).where(MachineDBModel.machine_id.in_(machine_ids))
         with self.session.begin() as session:
-            session.execute(stmt)
+            for chunk in batched(machine_ids, DELETE_CHUNK_SIZE):
+                session.execute(
+                    delete(MachineDBModel).where(MachineDBModel.machine_id.in_(chunk))
+                )
+        with self._machine_cache_lock:
+            for machine_id in machine_ids:
+                self._machine_cache.pop(machine_id, None)
@@ -79,12 +79,76 @@ class SignalModel:
     alert_id: Optional[int] = None
 
     def __init__(self, **kwargs):
-        names = set([f.name for f in fields(self)])
+        names = self._FIELD_NAMES
         for k, v in kwargs.items():
             if k in names:
                 setattr(self, k, v)
 
 
+# Computed once so __init__ does not rebuild the name set per instance.
+SignalModel._FIELD_NAMES = frozenset(f.name for f in fields(SignalModel))
+
+
+def _source_from_dict(d: dict) -> SourceModel:
+    return SourceModel(
+        ip=d.get("ip"),
+        range=d.get("range"),
+        scope=d.get("scope"),
+        latitude=d.get("latitude"),
+        as_number=d.get("as_number"),
+        cn=d.get("cn"),
+        value=d.get("value"),
+        as_name=d.get("as_name"),
+        longitude=d.get("longitude"),
+    )
+
+
+def _context_from_dict(d: dict) -> ContextModel:
+    return ContextModel(value=d.get("value"), key=d.get("key"))
+
+
+def _decision_from_dict(d: dict) -> DecisionModel:
+    return DecisionModel(
+        duration=d.get("duration"),
+        uuid=d.get("uuid"),
+        scenario=d.get("scenario"),
+        origin=d.get("origin"),
+        scope=d.get("scope"),
+        simulated=d.get("simulated"),
+        until=d.get("until"),
+        id=d.get("id"),
+        type=d.get("type"),
+        value=d.get("value"),
+    )
+
+
+def signal_from_dict(d: dict) -> SignalModel:
+    """Build a SignalModel from a plain dict.
+
+    Equivalent to dacite's from_dict for the dict shapes the storage
+    backends produce, without the per-call type introspection. Extra keys
+    (e.g. database ids on child rows) are ignored.
+    """
+    source = d.get("source")
+    return SignalModel(
+        created_at=d.get("created_at"),
+        machine_id=d.get("machine_id"),
+        source=None if source is None else _source_from_dict(source),
+        uuid=d.get("uuid"),
+        start_at=d.get("start_at"),
+        scenario=d.get("scenario"),
+        context=[_context_from_dict(c) for c in d.get("context") or []],
+        decisions=[_decision_from_dict(x) for x in d.get("decisions") or []],
+        stop_at=d.get("stop_at"),
+        message=d.get("message", ""),
+        scenario_trust=d.get("scenario_trust", "manual"),
+        scenario_hash=d.get("scenario_hash", ""),
+        scenario_version=d.get("scenario_version", ""),
+        sent=d.get("sent", False),
+        alert_id=d.get("alert_id"),
+    )
+
+
 class StorageInterface(ABC):
     @abstractmethod
     def get_signals(
@@ -110,6 +174,11 @@ class StorageInterface(ABC):
         # returns true if created new row else false
         raise NotImplementedError
 
+    def update_or_create_signals(self, signals: List[SignalModel]):
+        # backends with a bulk write path should override this
+        for signal in signals:
+            self.update_or_create_signal(signal)
+
     @abstractmethod
     def mass_update_signals(self, signal_ids: List[int], changes: dict):
         # changes is a dictionary with keys as the attributes to update and values as the new values
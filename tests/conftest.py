@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture
+def assert_all_responses_were_requested() -> bool:
+    # The suite registers one dispatch callback per test rather than
+    # per-endpoint responses, so pytest-httpx's teardown sweep over
+    # unrequested matchers buys nothing; skip it.
+    return False
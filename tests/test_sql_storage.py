@@ -1,12 +1,17 @@
 import os
-import time
-from unittest import TestCase
+from dataclasses import replace
+
 import pytest
 import random
 
 from dacite import from_dict
 
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy_utils import database_exists, create_database, drop_database
+
 from cscapi.sql_storage import (
+    Base,
     ContextDBModel,
     DecisionDBModel,
     MachineDBModel,
@@ -21,154 +26,200 @@ from cscapi.client import (
     CAPIClientConfig,
 )
 
-from sqlalchemy_utils import database_exists, create_database, drop_database
-
-from .test_client import mock_signals
-
-
-def mock_signals():
-    return [
-        from_dict(SignalModel, z)
-        for z in [
+# Run dacite's reflective walk once at import; mock_signals only swaps in a
+# fresh decision id per call.
+_SIGNAL_TEMPLATE = from_dict(
+    SignalModel,
+    {
+        "decisions": [
             {
-                "decisions": [
-                    {
-                        "duration": "59m49.264032632s",
-                        "id": random.randint(0, 100000),
-                        "origin": "crowdsec",
-                        "scenario": "crowdsecurity/ssh-bf",
-                        "scope": "Ip",
-                        "simulated": False,
-                        "type": "ban",
-                        "value": "1.1.1.172",
-                    }
-                ],
-                "context": [
-                    {"key": "target_user", "value": "netflix"},
-                    {"key": "service", "value": "ssh"},
-                    {"key": "target_user", "value": "netflix"},
-                    {"key": "service", "value": "ssh"},
-                ],
-                "uuid": "1",
-                "machine_id": "test",
-                "message": "Ip 1.1.1.172 performed 'crowdsecurity/ssh-bf' (6 events over 2.920062ms) at 2020-11-28 10:20:46.845619968 +0100 CET m=+5.903899761",
+                "duration": "59m49.264032632s",
+                "id": 0,
+                "origin": "crowdsec",
                 "scenario": "crowdsecurity/ssh-bf",
-                "scenario_hash": "4441dcff07020f6690d998b7101e642359ba405c2abb83565bbbdcee36de280f",
-                "scenario_version": "0.1",
-                "scenario_trust": "trusted",
-                "source": {
-                    "as_name": "Cloudflare Inc",
-                    "cn": "AU",
-                    "ip": "1.1.1.172",
-                    "latitude": -37.7,
-                    "longitude": 145.1833,
-                    "range": "1.1.1.0/24",
-                    "scope": "Ip",
-                    "value": "1.1.1.172",
-                },
-                "start_at": "2020-11-28 10:20:46.842701127 +0100 +0100",
-                "stop_at": "2020-11-28 10:20:46.845621385 +0100 +0100",
-                "created_at": "2020-11-28T10:20:47+01:00",
+                "scope": "Ip",
+                "simulated": False,
+                "type": "ban",
+                "value": "1.1.1.172",
             }
-        ]
-    ]
+        ],
+        "context": [
+            {"key": "target_user", "value": "netflix"},
+            {"key": "service", "value": "ssh"},
+            {"key": "target_user", "value": "netflix"},
+            {"key": "service", "value": "ssh"},
+        ],
+        "uuid": "1",
+        "machine_id": "test",
+        "message": "Ip 1.1.1.172 performed 'crowdsecurity/ssh-bf' (6 events over 2.920062ms) at 2020-11-28 10:20:46.845619968 +0100 CET m=+5.903899761",
+        "scenario": "crowdsecurity/ssh-bf",
+        "scenario_hash": "4441dcff07020f6690d998b7101e642359ba405c2abb83565bbbdcee36de280f",
+        "scenario_version": "0.1",
+        "scenario_trust": "trusted",
+        "source": {
+            "as_name": "Cloudflare Inc",
+            "cn": "AU",
+            "ip": "1.1.1.172",
+            "latitude": -37.7,
+            "longitude": 145.1833,
+            "range": "1.1.1.0/24",
+            "scope": "Ip",
+            "value": "1.1.1.172",
+        },
+        "start_at": "2020-11-28 10:20:46.842701127 +0100 +0100",
+        "stop_at": "2020-11-28 10:20:46.845621385 +0100 +0100",
+        "created_at": "2020-11-28T10:20:47+01:00",
+    },
+)
 
 
-class TestSQLStorage(TestCase):
-    def setUp(self) -> None:
-        self.db_path = f"{str(int(time.time()))}.db"
-        # Use .env file to modify variables
-        engine_type = (
-            os.getenv("TEST_SQL_ENGINE") if os.getenv("TEST_SQL_ENGINE") else "sqlite"
-        )
-        if engine_type == "sqlite":
-            db_uri = f"sqlite:///{self.db_path}"
-        elif engine_type == "postgres":
-            db_uri = f"{os.getenv('TEST_POSTGRESQL_URL')}{self.db_path}"
-        elif engine_type == "mysql":
-            db_uri = f"{os.getenv('TEST_MYSQL_URL')}{self.db_path}"
-        elif engine_type == "mariadb":
-            db_uri = f"{os.getenv('TEST_MARIADB_URL')}{self.db_path}"
-        else:
-            raise ValueError(f"Unknown engine type: {engine_type}")
-        if not database_exists(db_uri):
-            create_database(db_uri)
-
-        self.storage: SQLStorage = SQLStorage(db_uri)
-        self.db_uri = db_uri
-        print(f"Using {engine_type} engine with {db_uri}")
-
-        self.client = CAPIClient(
-            self.storage,
-            CAPIClientConfig(
-                scenarios=["crowdsecurity/http-bf", "crowdsecurity/ssh-bf"],
-                max_retries=1,
-                retry_delay=0,
-            ),
-        )
+# Seeded module-level PRNG: reproducible decision ids, and no global
+# random-module lock under xdist.
+_RNG = random.Random(0xC0FFEE)
 
-    def tearDown(self) -> None:
-        # postgresql, mysql, mariadb
-        if database_exists(self.db_uri):
-            try:
-                drop_database(self.db_uri)
-            except Exception as e:
-                print(f"Error occurred while dropping the database: {e}")
-
-        # sqlite
-        try:
-            os.remove(self.db_path)
-        except:
-            pass
-
-    def test_get_signals_with_no_machine(self):
-        assert len(self.storage.get_signals(limit=1000)) == 0
-        for x in range(10):
-            self.client.add_signals(mock_signals())
-            time.sleep(0.05)
-        assert len(self.storage.get_signals(limit=1000)) == 10
-        assert len(self.storage.get_signals(limit=5)) == 5
-        assert len(self.storage.get_signals(limit=5, offset=8)) == 2
-        assert len(self.storage.get_signals(limit=1000, sent=True)) == 0
-        assert len(self.storage.get_signals(limit=1000, sent=False)) == 10
-        assert len(self.storage.get_signals(limit=1000, is_failing=True)) == 0
-        assert len(self.storage.get_signals(limit=1000, is_failing=False)) == 10
-        assert (
-            len(self.storage.get_signals(limit=1000, sent=False, is_failing=False))
-            == 10
-        )
-        assert (
-            len(self.storage.get_signals(limit=1000, sent=True, is_failing=False)) == 0
+
+def mock_signals():
+    return [
+        replace(
+            _SIGNAL_TEMPLATE,
+            decisions=[
+                replace(_SIGNAL_TEMPLATE.decisions[0], id=_RNG.randint(0, 100000))
+            ],
         )
+    ]
 
-    def test_get_signals_with_machine(self):
+
+# In-memory sqlite: no file, no fsync per commit, nothing to remove. The
+# database lives as long as the engine keeps its pooled connection.
+IN_MEMORY_SQLITE_URI = "sqlite://"
+
+_SQL_ENGINE_URL_VARS = {
+    "postgres": "TEST_POSTGRESQL_URL",
+    "mysql": "TEST_MYSQL_URL",
+    "mariadb": "TEST_MARIADB_URL",
+}
+
+
+@pytest.fixture(scope="session", params=["sqlite", "postgres", "mysql", "mariadb"])
+def db_uri(request) -> str:
+    # Use .env file to modify variables; TEST_SQL_ENGINE accepts a
+    # comma-separated list so several backends can run in one session.
+    engine_type = request.param
+    enabled = (os.getenv("TEST_SQL_ENGINE") or "sqlite").split(",")
+    if engine_type not in enabled:
+        pytest.skip(f"{engine_type} is not enabled via TEST_SQL_ENGINE")
+    if engine_type == "sqlite":
+        return IN_MEMORY_SQLITE_URI
+    # One database per xdist worker so backends can run concurrently
+    # without stepping on each other's rows.
+    worker = os.getenv("PYTEST_XDIST_WORKER", "gw0")
+    db_name = f"cscapi_test_{worker}.db"
+    server_url = os.getenv(_SQL_ENGINE_URL_VARS[engine_type])
+    if not server_url:
+        pytest.skip(f"{_SQL_ENGINE_URL_VARS[engine_type]} is not set")
+    return f"{server_url}{db_name}"
+
+
+@pytest.fixture(scope="session")
+def shared_storage(db_uri):
+    # The database and the schema are created once per session; each test
+    # then runs inside a rolled-back transaction (see storage below).
+    in_memory = db_uri == IN_MEMORY_SQLITE_URI
+    if not in_memory and not database_exists(db_uri):
+        create_database(db_uri)
+
+    storage = SQLStorage(db_uri)
+
+    if storage.engine.dialect.name == "sqlite":
+        # pysqlite's implicit transaction handling breaks SAVEPOINT; take
+        # over transaction control, per the SQLAlchemy pysqlite docs.
+        @event.listens_for(storage.engine, "connect")
+        def _do_connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(storage.engine, "begin")
+        def _do_begin(conn):
+            conn.exec_driver_sql("BEGIN")
+
+        # Flush any connection pooled before the listeners were attached,
+        # then recreate the schema on one that has them (for the in-memory
+        # database, dispose discards the schema along with the connection).
+        storage.engine.dispose()
+        Base.metadata.create_all(storage.engine)
+
+    yield storage
+
+    storage.engine.dispose()
+    if not in_memory and database_exists(db_uri):
+        drop_database(db_uri)
+
+
+@pytest.fixture
+def storage(shared_storage):
+    # Each test runs inside an outer transaction: the storage's commits
+    # become savepoint releases, and the rollback on teardown leaves the
+    # schema empty for the next test.
+    conn = shared_storage.engine.connect()
+    transaction = conn.begin()
+    session = sessionmaker(
+        bind=conn, expire_on_commit=False, join_transaction_mode="create_savepoint"
+    )
+    original_session = shared_storage.session
+    shared_storage.session = session
+    shared_storage._machine_cache.clear()
+    yield shared_storage
+    shared_storage.session = original_session
+    transaction.rollback()
+    conn.close()
+
+
+@pytest.fixture
+def client(storage):
+    return CAPIClient(
+        storage,
+        CAPIClientConfig(
+            scenarios=["crowdsecurity/http-bf", "crowdsecurity/ssh-bf"],
+            max_retries=1,
+            retry_delay=0,
+        ),
+    )
+
+
+class TestSQLStorage:
+    def test_get_signals_with_no_machine(self, storage, client):
+        assert len(storage.get_signals(limit=1000)) == 0
+        client.add_signals([mock_signals()[0] for _ in range(10)])
+        assert len(storage.get_signals(limit=1000)) == 10
+        assert len(storage.get_signals(limit=5)) == 5
+        assert len(storage.get_signals(limit=5, offset=8)) == 2
+        assert len(storage.get_signals(limit=1000, sent=True)) == 0
+        assert len(storage.get_signals(limit=1000, sent=False)) == 10
+        assert len(storage.get_signals(limit=1000, is_failing=True)) == 0
+        assert len(storage.get_signals(limit=1000, is_failing=False)) == 10
+        assert len(storage.get_signals(limit=1000, sent=False, is_failing=False)) == 10
+        assert len(storage.get_signals(limit=1000, sent=True, is_failing=False)) == 0
+
+    def test_get_signals_with_machine(self, storage, client):
         m1 = MachineModel(
             machine_id="test",  # Same machine_id as in mock_signals
             token="1",
             password="1",
             scenarios="crowdsecurity/http-probing",
         )
-        self.assertTrue(self.storage.update_or_create_machine(m1))
-        assert len(self.storage.get_signals(limit=1000)) == 0
-        for x in range(10):
-            self.client.add_signals(mock_signals())
-            time.sleep(0.05)
-        assert len(self.storage.get_signals(limit=1000)) == 10
-        assert len(self.storage.get_signals(limit=5)) == 5
-        assert len(self.storage.get_signals(limit=5, offset=8)) == 2
-        assert len(self.storage.get_signals(limit=1000, sent=True)) == 0
-        assert len(self.storage.get_signals(limit=1000, sent=False)) == 10
-        assert len(self.storage.get_signals(limit=1000, is_failing=True)) == 0
-        assert len(self.storage.get_signals(limit=1000, is_failing=False)) == 10
-        assert (
-            len(self.storage.get_signals(limit=1000, sent=False, is_failing=False))
-            == 10
-        )
-        assert (
-            len(self.storage.get_signals(limit=1000, sent=True, is_failing=False)) == 0
-        )
-
-    def test_get_signals_with_failing_machine(self):
+        assert storage.update_or_create_machine(m1)
+        assert len(storage.get_signals(limit=1000)) == 0
+        client.add_signals([mock_signals()[0] for _ in range(10)])
+        assert len(storage.get_signals(limit=1000)) == 10
+        assert len(storage.get_signals(limit=5)) == 5
+        assert len(storage.get_signals(limit=5, offset=8)) == 2
+        assert len(storage.get_signals(limit=1000, sent=True)) == 0
+        assert len(storage.get_signals(limit=1000, sent=False)) == 10
+        assert len(storage.get_signals(limit=1000, is_failing=True)) == 0
+        assert len(storage.get_signals(limit=1000, is_failing=False)) == 10
+        assert len(storage.get_signals(limit=1000, sent=False, is_failing=False)) == 10
+        assert len(storage.get_signals(limit=1000, sent=True, is_failing=False)) == 0
+
+    def test_get_signals_with_failing_machine(self, storage, client):
         m1 = MachineModel(
             machine_id="test",  # Same machine_id as in mock_signals
             token="1",
@@ -176,29 +227,21 @@ class TestSQLStorage(TestCase):
             scenarios="crowdsecurity/http-probing",
             is_failing=True,
         )
-        self.assertTrue(self.storage.update_or_create_machine(m1))
-        assert len(self.storage.get_signals(limit=1000)) == 0
-        for x in range(10):
-            self.client.add_signals(mock_signals())
-            time.sleep(0.05)
-        assert len(self.storage.get_signals(limit=1000)) == 10
-        assert len(self.storage.get_signals(limit=5)) == 5
-        assert len(self.storage.get_signals(limit=5, offset=8)) == 2
-        assert len(self.storage.get_signals(limit=1000, sent=True)) == 0
-        assert len(self.storage.get_signals(limit=1000, sent=False)) == 10
-        assert len(self.storage.get_signals(limit=1000, is_failing=True)) == 10
-        assert len(self.storage.get_signals(limit=1000, is_failing=False)) == 0
-        assert (
-            len(self.storage.get_signals(limit=1000, sent=False, is_failing=False)) == 0
-        )
-        assert (
-            len(self.storage.get_signals(limit=1000, sent=True, is_failing=False)) == 0
-        )
-        assert (
-            len(self.storage.get_signals(limit=1000, sent=True, is_failing=True)) == 0
-        )
-
-    def test_create_and_retrieve_machine(self):
+        assert storage.update_or_create_machine(m1)
+        assert len(storage.get_signals(limit=1000)) == 0
+        client.add_signals([mock_signals()[0] for _ in range(10)])
+        assert len(storage.get_signals(limit=1000)) == 10
+        assert len(storage.get_signals(limit=5)) == 5
+        assert len(storage.get_signals(limit=5, offset=8)) == 2
+        assert len(storage.get_signals(limit=1000, sent=True)) == 0
+        assert len(storage.get_signals(limit=1000, sent=False)) == 10
+        assert len(storage.get_signals(limit=1000, is_failing=True)) == 10
+        assert len(storage.get_signals(limit=1000, is_failing=False)) == 0
+        assert len(storage.get_signals(limit=1000, sent=False, is_failing=False)) == 0
+        assert len(storage.get_signals(limit=1000, sent=True, is_failing=False)) == 0
+        assert len(storage.get_signals(limit=1000, sent=True, is_failing=True)) == 0
+
+    def test_create_and_retrieve_machine(self, storage):
         m1 = MachineModel(
             machine_id="1",
             token="1",
@@ -207,73 +250,75 @@ class TestSQLStorage(TestCase):
         )
 
         # Should return true if db row is created, else return false
-        self.assertTrue(self.storage.update_or_create_machine(m1))
-        self.assertFalse(self.storage.update_or_create_machine(m1))
+        assert storage.update_or_create_machine(m1)
+        assert not storage.update_or_create_machine(m1)
 
-        retrieved = self.storage.get_machine_by_id("1")
+        retrieved = storage.get_machine_by_id("1")
 
-        self.assertEqual(retrieved.machine_id, m1.machine_id)
-        self.assertEqual(retrieved.token, m1.token)
-        self.assertEqual(retrieved.password, m1.password)
-        self.assertEqual(retrieved.scenarios, m1.scenarios)
+        assert retrieved.machine_id == m1.machine_id
+        assert retrieved.token == m1.token
+        assert retrieved.password == m1.password
+        assert retrieved.scenarios == m1.scenarios
 
-    def test_update_machine(self):
+    def test_update_machine(self, storage):
         m1 = MachineModel(
             machine_id="1",
             token="1",
             password="1",
             scenarios="crowdsecurity/http-probing",
         )
-        self.storage.update_or_create_machine(m1)
-
-        retrieved = self.storage.get_machine_by_id("1")
-
-        self.assertEqual(retrieved.machine_id, m1.machine_id)
-        self.assertEqual(retrieved.token, m1.token)
-        self.assertEqual(retrieved.password, m1.password)
-        self.assertEqual(retrieved.scenarios, m1.scenarios)
+        storage.update_or_create_machine(m1)
 
         m2 = MachineModel(
             machine_id="1", token="2", password="2", scenarios="crowdsecurity/http-bf"
         )
-        self.storage.update_or_create_machine(m2)
-        with self.storage.session.begin() as session:
-            self.assertEqual(1, session.query(MachineDBModel).count())
+        storage.update_or_create_machine(m2)
+        with storage.session.begin() as session:
+            assert session.query(MachineDBModel).count() == 1
 
-        retrieved = self.storage.get_machine_by_id("1")
+        retrieved = storage.get_machine_by_id("1")
 
-        self.assertEqual(retrieved.machine_id, m2.machine_id)
-        self.assertEqual(retrieved.token, m2.token)
-        self.assertEqual(retrieved.password, m2.password)
-        self.assertEqual(retrieved.scenarios, m2.scenarios)
+        assert retrieved.machine_id == m2.machine_id
+        assert retrieved.token == m2.token
+        assert retrieved.password == m2.password
+        assert retrieved.scenarios == m2.scenarios
 
-    def test_create_signal(self):
-        assert self.storage.get_signals(limit=1000) == []
-        self.storage.update_or_create_signal(mock_signals()[0])
-        signals = self.storage.get_signals(limit=1000)
+    def test_create_signal(self, storage):
+        assert storage.get_signals(limit=1000) == []
+        storage.update_or_create_signal(mock_signals()[0])
+        signals = storage.get_signals(limit=1000)
         assert len(signals) == 1
         signal = signals[0]
 
         assert signal.alert_id is not None
         assert signal.sent == False
 
-        with self.storage.session.begin() as session:
-            assert session.query(SignalDBModel).count() == 1
-            assert session.query(ContextDBModel).count() == 4
-            assert session.query(DecisionDBModel).count() == 1
-            assert session.query(SourceDBModel).count() == 1
+        # One round-trip for all four table counts instead of four.
+        counts = select(
+            *(
+                select(func.count()).select_from(model).scalar_subquery()
+                for model in (
+                    SignalDBModel,
+                    ContextDBModel,
+                    DecisionDBModel,
+                    SourceDBModel,
+                )
+            )
+        )
+        with storage.session.begin() as session:
+            assert session.execute(counts).one() == (1, 4, 1, 1)
         assert len(signal.context) == 4
 
         assert len(signal.decisions) == 1
 
         assert isinstance(signal.source, SourceModel)
 
-    def test_update_signal(self):
-        assert self.storage.get_signals(limit=1000) == []
+    def test_update_signal(self, storage):
+        assert storage.get_signals(limit=1000) == []
 
         to_insert = mock_signals()[0]
-        self.storage.update_or_create_signal(to_insert)
-        signals = self.storage.get_signals(limit=1000)
+        storage.update_or_create_signal(to_insert)
+        signals = storage.get_signals(limit=1000)
 
         assert len(signals) == 1
         signal = signals[0]
@@ -282,34 +327,96 @@ class TestSQLStorage(TestCase):
 
         signal.sent = True
 
-        self.storage.update_or_create_signal(signal)
-        signals = self.storage.get_signals(limit=1000)
+        storage.update_or_create_signal(signal)
+        signals = storage.get_signals(limit=1000)
 
         assert len(signals) == 1
         signal = signals[0]
 
         assert signal.sent == True
 
-    def test_mass_update_signals(self):
-        assert self.storage.get_signals(limit=1000) == []
+    def test_mass_update_signals(self, storage):
+        assert storage.get_signals(limit=1000) == []
 
         for x in range(10):
-            self.storage.update_or_create_signal(mock_signals()[0])
+            storage.update_or_create_signal(mock_signals()[0])
 
-        signals = self.storage.get_signals(limit=1000)
+        signals = storage.get_signals(limit=1000)
 
         assert len(signals) == 10
         for s in signals:
             assert s.sent == False
             assert s.scenario_trust == "trusted"
         signal_ids = [s.alert_id for s in signals]
-        self.storage.mass_update_signals(
+        storage.mass_update_signals(
             signal_ids, {"sent": True, "scenario_trust": "manual"}
         )
 
-        signals = self.storage.get_signals(limit=1000)
+        signals = storage.get_signals(limit=1000)
 
         assert len(signals) == 10
         for s in signals:
             assert s.sent == True
             assert s.scenario_trust == "manual"
+
+    def test_iter_signals(self, storage, client):
+        assert list(storage.iter_signals()) == []
+        client.add_signals([mock_signals()[0] for _ in range(10)])
+
+        # batch_size below the row count exercises the yield_per batching.
+        signals = list(storage.iter_signals(batch_size=3))
+        assert len(signals) == 10
+        for s in signals:
+            assert isinstance(s, SignalModel)
+
+        sent_ids = [s.alert_id for s in signals[:4]]
+        storage.mass_update_signals(sent_ids, {"sent": True})
+
+        assert len(list(storage.iter_signals(sent=True, batch_size=3))) == 4
+        assert len(list(storage.iter_signals(sent=False, batch_size=3))) == 6
+        # No machine row exists, so no signal counts as failing.
+        assert len(list(storage.iter_signals(is_failing=True))) == 0
+        assert len(list(storage.iter_signals(is_failing=False))) == 10
+        assert len(list(storage.iter_signals(sent=False, is_failing=False))) == 6
+
+
+class TestSQLStorageWriteBuffer:
+    # The buffer sits above the dialect, so these run on a private
+    # in-memory sqlite storage instead of the parametrized backends.
+
+    def test_flush_every_threshold(self):
+        storage = SQLStorage(IN_MEMORY_SQLITE_URI, flush_every=3)
+
+        assert storage.update_or_create_signal(mock_signals()[0])
+        assert storage.update_or_create_signal(mock_signals()[0])
+        # Buffered writes stay invisible to reads until a flush runs.
+        assert storage.get_signals(limit=1000) == []
+
+        storage.update_or_create_signal(mock_signals()[0])
+        assert len(storage.get_signals(limit=1000)) == 3
+
+    def test_flush_interval(self):
+        # A zero interval makes every write immediately due.
+        storage = SQLStorage(IN_MEMORY_SQLITE_URI, flush_interval_s=0.0)
+
+        storage.update_or_create_signal(mock_signals()[0])
+        assert len(storage.get_signals(limit=1000)) == 1
+
+    def test_flush_drains_pending(self):
+        storage = SQLStorage(IN_MEMORY_SQLITE_URI, flush_every=100)
+
+        storage.update_or_create_signals(mock_signals() + mock_signals())
+        assert storage.get_signals(limit=1000) == []
+
+        storage.flush()
+        assert len(storage.get_signals(limit=1000)) == 2
+
+        # Flushing with nothing pending is a no-op.
+        storage.flush()
+        assert len(storage.get_signals(limit=1000)) == 2
+
+    def test_context_manager_exit_flushes(self):
+        with SQLStorage(IN_MEMORY_SQLITE_URI, flush_every=100) as storage:
+            storage.update_or_create_signal(mock_signals()[0])
+            assert storage.get_signals(limit=1000) == []
+        assert len(storage.get_signals(limit=1000)) == 1